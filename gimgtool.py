@@ -17,21 +17,78 @@
 
 import os
 import sys
+import mmap
+import errno
 import struct
 import shutil
 import tempfile
 import argparse
 import fnmatch
+import re
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import time
 
 VERSION = "2.0.0"
 SECTOR_SIZE = 2048
+EXTRACT_WORKERS = 8
+PROGRESS_INTERVAL = 256
+
+# Precompiled layouts, saves re-parsing the format string on every call
+_U32 = struct.Struct('<I')
+# Directory entry: sector offset, size in bytes, 24-byte filename
+_DIR_ENTRY = struct.Struct('<II24s')
+
+# errno values meaning the kernel can't copy between this pair of files
+_NO_KERNEL_COPY = (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP)
+
+
+def _kernel_copy(src_fd: int, dst_fd: int, count: int, offset: Optional[int] = None) -> bool:
+    """Copy count bytes between file descriptors without going through Python buffers
+
+    Reads from offset when given (the source position is left alone), otherwise
+    from the current source position, and writes at the current destination
+    position. Returns False when neither copy_file_range nor sendfile works for
+    these files, in which case nothing has been copied.
+    """
+    for method in ('copy_file_range', 'sendfile'):
+        if not hasattr(os, method):
+            continue
+
+        copied = 0
+        try:
+            while copied < count:
+                position = None if offset is None else offset + copied
+                if method == 'copy_file_range':
+                    sent = os.copy_file_range(src_fd, dst_fd, count - copied, position)
+                else:
+                    sent = os.sendfile(dst_fd, src_fd, position, count - copied)
+
+                # Source is shorter than expected
+                if sent == 0:
+                    break
+                copied += sent
+            return True
+        except OSError as e:
+            if copied or e.errno not in _NO_KERNEL_COPY:
+                raise
+
+    return False
+
 
 class IMGTool:
-    def __init__(self):
+    def __init__(self, verbose: bool = False):
         self.temp_dir = None
+        self.verbose = verbose
+
+    def _show_progress(self, count: int, total: int):
+        """Update a single status line instead of printing every entry"""
+        if count % PROGRESS_INTERVAL == 0 or count == total:
+            sys.stdout.write(f"\r{count}/{total}")
+            if count == total:
+                sys.stdout.write("\n")
+            sys.stdout.flush()
 
     def __enter__(self):
         self.temp_dir = tempfile.mkdtemp(prefix='imgtool_')
@@ -48,129 +105,204 @@ class IMGTool:
 
         try:
             with open(img_file, 'rb') as f:
-                # Check for VER2 signature
-                signature = f.read(4)
-                if signature == b'VER2':
-                    return "VER2"
+                return self._detect_format(f, os.fstat(f.fileno()).st_size)
+        except (IOError, struct.error):
+            return "INVALID"
 
-                # For VER1, do heuristic checks
-                file_size = os.path.getsize(img_file)
-                if file_size < 32:
-                    return "INVALID"
+    def get_entry_count(self, img_file: str, format_type: str) -> int:
+        """Get number of entries in IMG file"""
+        with open(img_file, 'rb') as f:
+            return self._count_entries(f, format_type, os.fstat(f.fileno()).st_size)
 
-                # VER1 starts directly with directory entries
-                f.seek(0)
-                first_offset = struct.unpack('<I', f.read(4))[0]
-                first_size = struct.unpack('<I', f.read(4))[0]
+    def _probe_img(self, img_file: str) -> Tuple[str, int]:
+        """Detect format and entry count with a single open, entry count is 0 when INVALID"""
+        if not os.path.isfile(img_file):
+            return "INVALID", 0
 
-                # Basic sanity checks for VER1
-                if first_offset > 0 and first_size > 0 and first_size < file_size:
-                    return "VER1"
+        try:
+            with open(img_file, 'rb') as f:
+                file_size = os.fstat(f.fileno()).st_size
+                format_type = self._detect_format(f, file_size)
+                if format_type == "INVALID":
+                    return format_type, 0
+                return format_type, self._count_entries(f, format_type, file_size)
 
         except (IOError, struct.error):
-            pass
+            return "INVALID", 0
+
+    def _detect_format(self, f, file_size: int) -> str:
+        """Detect IMG format version of an open file"""
+        # Check for VER2 signature
+        f.seek(0)
+        signature = f.read(4)
+        if signature == b'VER2':
+            return "VER2"
+
+        # For VER1, do heuristic checks
+        if file_size < 32:
+            return "INVALID"
+
+        # VER1 starts directly with directory entries
+        f.seek(0)
+        first_offset = _U32.unpack(f.read(4))[0]
+        first_size = _U32.unpack(f.read(4))[0]
+
+        # Basic sanity checks for VER1
+        if first_offset > 0 and first_size > 0 and first_size < file_size:
+            return "VER1"
 
         return "INVALID"
 
-    def get_entry_count(self, img_file: str, format_type: str) -> int:
-        """Get number of entries in IMG file"""
-        with open(img_file, 'rb') as f:
-            if format_type == "VER2":
-                f.seek(4)
-                return struct.unpack('<I', f.read(4))[0]
-            elif format_type == "VER1":
-                # Calculate entry count for VER1
-                file_size = os.path.getsize(img_file)
-                entry_count = 0
-                offset = 0
-
-                while offset < file_size:
-                    f.seek(offset)
-                    try:
-                        file_offset = struct.unpack('<I', f.read(4))[0]
-                        file_size_entry = struct.unpack('<I', f.read(4))[0]
-
-                        if file_offset == 0 and file_size_entry == 0:
-                            break
-
-                        if file_offset > 0 and file_size_entry > 0:
-                            entry_count += 1
-                            offset += 32
-                        else:
-                            break
-
-                        # Safety check
-                        if entry_count > 10000:
-                            break
-
-                    except struct.error:
-                        break
-
-                return entry_count
+    def _count_entries(self, f, format_type: str, file_size: int) -> int:
+        """Get number of entries in an open IMG file"""
+        if format_type == "VER2":
+            f.seek(4)
+            return _U32.unpack(f.read(4))[0]
+        elif format_type == "VER1":
+            # Calculate entry count for VER1, read the most the scan can cover in
+            # one go and walk it in memory instead of a seek+read per entry
+            f.seek(0)
+            buf = f.read(min(file_size, 32 * 10001))
+            entry_count = 0
+
+            for offset in range(0, len(buf) - 7, 32):
+                file_offset = _U32.unpack_from(buf, offset)[0]
+                file_size_entry = _U32.unpack_from(buf, offset + 4)[0]
+
+                if file_offset == 0 or file_size_entry == 0:
+                    break
+
+                entry_count += 1
+
+                # Safety check
+                if entry_count > 10000:
+                    break
+
+            return entry_count
         return 0
 
-    def extract_img(self, img_file: str, output_dir: str) -> bool:
-        """Extract all files from IMG archive"""
+    def _read_directory(self, f, dir_start: int, entry_count: int,
+                        with_names: bool = True) -> Tuple[Tuple[int, ...], Tuple[int, ...], List[str]]:
+        """Read the whole directory in one go and return it as (sectors, sizes, filenames) columns
+
+        Callers that only need offsets/sizes can pass with_names=False to skip
+        decoding the filenames, the filename column is then empty.
+        """
+        f.seek(dir_start)
+        dir_bytes = f.read(entry_count * _DIR_ENTRY.size)
+
+        # Drop a trailing partial entry if the file is truncated
+        dir_bytes = dir_bytes[:len(dir_bytes) - len(dir_bytes) % _DIR_ENTRY.size]
+        if not dir_bytes:
+            return (), (), []
+
+        # Transpose rows into columns so callers can work on a whole field at once
+        offsets, sizes, raw_names = zip(*_DIR_ENTRY.iter_unpack(dir_bytes))
+        if not with_names:
+            return offsets, sizes, []
+
+        # Take everything up to first null byte, strip whitespace. find() + one
+        # slice avoids building a throwaway list per entry like split() does
+        names = []
+        for filename_bytes in raw_names:
+            end = filename_bytes.find(b'\x00')
+            names.append(filename_bytes[:end if end >= 0 else 24].strip().decode('ascii', errors='ignore'))
+
+        return offsets, sizes, names
+
+    def _extract_entry(self, src_fd: int, mv: memoryview, output_path: str, byte_offset: int, file_size: int):
+        """Write one entry's data out to output_path, safe to run from worker threads"""
+        with open(output_path, 'wb') as out_f:
+            if not _kernel_copy(src_fd, out_f.fileno(), file_size, byte_offset):
+                out_f.write(mv[byte_offset:byte_offset + file_size])
+
+    def extract_img(self, img_file: str, output_dir: str, *, format_type: Optional[str] = None,
+                    entry_count: Optional[int] = None) -> bool:
+        """Extract all files from IMG archive
+
+        Callers that already probed the IMG can pass format_type and
+        entry_count to save re-reading the header.
+        """
         if not os.path.isfile(img_file):
             print(f"Error: IMG file not found: {img_file}", file=sys.stderr)
             return False
 
         os.makedirs(output_dir, exist_ok=True)
 
-        # Detect format
-        format_type = self.detect_img_format(img_file)
+        # Detect format, unless the caller already did
+        if format_type is None:
+            format_type, entry_count = self._probe_img(img_file)
+        elif entry_count is None:
+            entry_count = self.get_entry_count(img_file, format_type)
+
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
         print(f"Detected format: {format_type}")
 
-        entry_count = self.get_entry_count(img_file, format_type)
         dir_start = 8 if format_type == "VER2" else 0
 
         print(f"Extracting {entry_count} files from {img_file}")
 
         with open(img_file, 'rb') as f:
-            for i in range(entry_count):
-                dir_offset = dir_start + i * 32
-                f.seek(dir_offset)
-
-                try:
-                    file_offset = struct.unpack('<I', f.read(4))[0]
-                    file_size = struct.unpack('<I', f.read(4))[0]
-                    #filename = f.read(24).rstrip(b'\x00').decode('ascii', errors='ignore')
-
-                    filename_bytes = f.read(24)
-                    # Take everything up to first null byte, strip whitespace
-                    filename = filename_bytes.split(b'\x00')[0].strip().decode('ascii', errors='ignore')
-
-
-                    # Skip empty entries
-                    if not filename or file_size == 0:
-                        continue
-
-                    # Calculate byte offset
-                    byte_offset = file_offset * SECTOR_SIZE
-
-                    print(f"Extracting: {filename} (size: {file_size} bytes)")
-
-                    # Extract file
-                    f.seek(byte_offset)
-                    file_data = f.read(file_size)
-
-                    output_path = os.path.join(output_dir, filename)
-                    with open(output_path, 'wb') as out_f:
-                        out_f.write(file_data)
-
-                except (struct.error, IOError) as e:
-                    print(f"Error extracting file {i}: {e}", file=sys.stderr)
-                    continue
+            offsets, sizes, names = self._read_directory(f, dir_start, entry_count)
+
+            # Entries are copied in the kernel, the mapping is the fallback when that's unavailable
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            mv = memoryview(mm)
+
+            # Let the kernel read ahead aggressively, and visit entries in on-disk order so
+            # those reads stream through the archive instead of seeking back and forth.
+            # A duplicate name keeps its last non-empty directory entry, same as extracting in order.
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            last_index = {filename: i for i, filename in enumerate(names) if filename and sizes[i]}
+            order = sorted(last_index.values(), key=offsets.__getitem__)
+
+            try:
+                # Entries are independent, copy several at once to keep the disk busy.
+                # Every copy passes an explicit offset so the shared descriptor never seeks.
+                with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as pool:
+                    jobs = []
+                    for i in order:
+                        file_offset, file_size, filename = offsets[i], sizes[i], names[i]
+
+                        # Skip empty entries
+                        if not filename or file_size == 0:
+                            continue
+
+                        # Calculate byte offset
+                        byte_offset = file_offset * SECTOR_SIZE
+
+                        output_path = os.path.join(output_dir, filename)
+                        job = pool.submit(self._extract_entry, f.fileno(), mv, output_path, byte_offset, file_size)
+                        jobs.append((i, filename, file_size, job))
+
+                    for count, (i, filename, file_size, job) in enumerate(jobs, 1):
+                        try:
+                            job.result()
+                            if self.verbose:
+                                print(f"Extracting: {filename} (size: {file_size} bytes)")
+                        except IOError as e:
+                            print(f"Error extracting file {i}: {e}", file=sys.stderr)
+
+                        if not self.verbose:
+                            self._show_progress(count, len(jobs))
+            finally:
+                mv.release()
+                mm.close()
 
         print("Extraction complete!")
         return True
 
-    def create_img(self, format_type: str, img_file: str, input_dir: str) -> bool:
-        """Create IMG file from directory"""
+    def create_img(self, format_type: str, img_file: str, input_dir: str, optimize_layout: bool = False) -> bool:
+        """Create IMG file from directory
+
+        The directory is always sorted by name. With optimize_layout the data
+        blocks are laid out largest first, which keeps the small files next to
+        each other; entries are looked up by name so data order is free.
+        """
         if not os.path.isdir(input_dir):
             print(f"Error: Input directory not found: {input_dir}", file=sys.stderr)
             return False
@@ -181,9 +313,9 @@ class IMGTool:
             print(f"Error: Invalid format '{format_type}'. Use 'ver1' or 'ver2'", file=sys.stderr)
             return False
 
-        # Get list of files
-        files = sorted([f for f in os.listdir(input_dir)
-                       if os.path.isfile(os.path.join(input_dir, f))])
+        # Get list of files, DirEntry caches the stat for the size lookup below
+        with os.scandir(input_dir) as it:
+            files = sorted([entry for entry in it if entry.is_file()], key=lambda entry: entry.name)
 
         if not files:
             print(f"Error: No files found in directory: {input_dir}", file=sys.stderr)
@@ -196,22 +328,26 @@ class IMGTool:
         dir_size = header_size + len(files) * 32
         data_start_sector = (dir_size + SECTOR_SIZE - 1) // SECTOR_SIZE
 
-        with open(img_file, 'wb') as f:
+        # Unbuffered so kernel-side copies and our own writes share one file position
+        with open(img_file, 'wb', buffering=0) as f:
             # Write header (VER2 only)
             if format_type == "VER2":
-                f.write(b'VER2')
-                f.write(struct.pack('<I', len(files)))
+                f.write(b'VER2' + _U32.pack(len(files)))
 
-            # Pad to directory size
-            f.write(b'\x00' * (dir_size - header_size))
-
-            # Calculate file positions and write directory
+            # Calculate file positions and build the directory in memory
             current_sector = data_start_sector
             file_info = []
+            dir_buf = bytearray(len(files) * _DIR_ENTRY.size)
 
-            for i, filename in enumerate(files):
-                filepath = os.path.join(input_dir, filename)
-                filesize = os.path.getsize(filepath)
+            # (directory slot, file) in the order the data gets written
+            layout = list(enumerate(files))
+            if optimize_layout:
+                layout.sort(key=lambda slot: slot[1].stat().st_size, reverse=True)
+
+            for count, (i, entry) in enumerate(layout, 1):
+                filename = entry.name
+                filepath = entry.path
+                filesize = entry.stat().st_size
 
                 # Check filename length
                 if len(filename) > 24:
@@ -220,35 +356,121 @@ class IMGTool:
 
                 sectors_needed = (filesize + SECTOR_SIZE - 1) // SECTOR_SIZE
 
-                # Write directory entry
-                dir_offset = (8 if format_type == "VER2" else 0) + i * 32
-                f.seek(dir_offset)
-                f.write(struct.pack('<I', current_sector))
-                f.write(struct.pack('<I', filesize))
-                f.write(filename.encode('ascii')[:24].ljust(24, b'\x00'))
+                # Fill in directory entry, the name is null padded to 24 bytes
+                _DIR_ENTRY.pack_into(dir_buf, i * _DIR_ENTRY.size, current_sector, filesize,
+                                     filename.encode('ascii'))
 
                 file_info.append((filepath, filesize, current_sector))
-                print(f"Added: {filename} (sector: {current_sector}, size: {filesize})")
+                if self.verbose:
+                    print(f"Added: {filename} (sector: {current_sector}, size: {filesize})")
+                else:
+                    self._show_progress(count, len(files))
                 current_sector += sectors_needed
 
-            # Pad to data section
-            data_start_byte = data_start_sector * SECTOR_SIZE
-            f.seek(data_start_byte)
+            # Write the whole directory in one go
+            f.write(dir_buf)
+
+            # Reserve the whole archive up front so the data gets contiguous extents
+            # instead of growing the file write by write
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(f.fileno(), 0, current_sector * SECTOR_SIZE)
+                except OSError:
+                    # Only an optimisation, not every filesystem supports it
+                    pass
 
-            # Write file data
+            # Write file data, seeking to each file's sector leaves the padding
+            # unwritten so it reads back as zeros without us writing any
             for filepath, filesize, sector in file_info:
+                f.seek(sector * SECTOR_SIZE)
                 with open(filepath, 'rb') as src_f:
-                    data = src_f.read()
-                    f.write(data)
+                    # Stream in 1MB chunks rather than holding the whole file in memory
+                    if not _kernel_copy(src_f.fileno(), f.fileno(), filesize):
+                        shutil.copyfileobj(src_f, f, 1024 * 1024)
 
-                    # Pad to sector boundary
-                    padding = SECTOR_SIZE - (filesize % SECTOR_SIZE)
-                    if padding != SECTOR_SIZE:
-                        f.write(b'\x00' * padding)
+            # Pad the last file to a sector boundary
+            f.truncate(current_sector * SECTOR_SIZE)
 
         print(f"{format_type} IMG file created: {img_file}")
         return True
 
+    def _compact_directory(self, f, dir_start: int, format_type: str, entry_count: int,
+                           keep: List[int]):
+        """Rewrite the directory with only the entries in keep and zero the freed tail
+
+        The data stays where it is until the next rebuild.
+        """
+        f.seek(dir_start)
+        dir_bytes = f.read(entry_count * _DIR_ENTRY.size)
+        new_dir = b''.join(dir_bytes[i * _DIR_ENTRY.size:(i + 1) * _DIR_ENTRY.size] for i in keep)
+
+        f.seek(dir_start)
+        f.write(new_dir.ljust(len(dir_bytes), b'\x00'))
+
+        if format_type == "VER2":
+            f.seek(4)
+            f.write(_U32.pack(len(keep)))
+
+    def _append_in_place(self, img_file: str, format_type: str, entry_count: int,
+                         new_files: Dict[str, str]) -> bool:
+        """Append files to the end of the IMG and point their directory entries at them
+
+        Existing entries with the same name are updated and their earlier
+        duplicates dropped, new names get a new directory entry. Returns False without touching the IMG when the
+        directory has no room left before the first data sector.
+        """
+        dir_start = 8 if format_type == "VER2" else 0
+
+        with open(img_file, 'r+b', buffering=0) as f:
+            offsets, sizes, names = self._read_directory(f, dir_start, entry_count)
+            entry_index = {filename: i for i, filename in enumerate(names) if filename}
+            next_index = len(names)
+
+            # New entries must fit between the directory and the first file's data
+            new_count = len(names) + sum(1 for filename in new_files if filename not in entry_index)
+            dir_end = dir_start + new_count * _DIR_ENTRY.size
+            first_data = min((offset * SECTOR_SIZE for offset, size in zip(offsets, sizes) if size),
+                             default=None)
+            if first_data is not None and dir_end > first_data:
+                return False
+
+            file_end = f.seek(0, os.SEEK_END)
+            current_sector = (max(file_end, dir_end) + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+            for filename, filepath in new_files.items():
+                filesize = os.path.getsize(filepath)
+
+                # Write the data first so the entry never points at missing data
+                f.seek(current_sector * SECTOR_SIZE)
+                with open(filepath, 'rb') as src_f:
+                    if not _kernel_copy(src_f.fileno(), f.fileno(), filesize):
+                        shutil.copyfileobj(src_f, f, 1024 * 1024)
+
+                index = entry_index.get(filename)
+                if index is None:
+                    index = next_index
+                    next_index += 1
+                f.seek(dir_start + index * _DIR_ENTRY.size)
+                f.write(_DIR_ENTRY.pack(current_sector, filesize, filename.encode('ascii')[:24].ljust(24, b'\x00')))
+
+                current_sector += (filesize + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+            # Pad the last file to a sector boundary
+            f.truncate(current_sector * SECTOR_SIZE)
+
+            # Earlier entries with a replaced name would still list the old data
+            keep = [i for i, filename in enumerate(names)
+                    if filename not in new_files or i == entry_index[filename]]
+            keep.extend(range(len(names), next_index))
+
+            if len(keep) < next_index:
+                self._compact_directory(f, dir_start, format_type, next_index, keep)
+            elif format_type == "VER2":
+                f.seek(4)
+                f.write(_U32.pack(new_count))
+
+        return True
+
     def add_multiple_to_img(self, img_file: str, files_to_add: List[str]) -> bool:
         """Add multiple files to existing IMG"""
         if not files_to_add:
@@ -256,24 +478,21 @@ class IMGTool:
             return False
 
         # Detect format
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
-        work_dir = os.path.join(self.temp_dir, 'img_work')
-
-        # Extract existing IMG
-        print("Extracting existing IMG...")
-        if not self.extract_img(img_file, work_dir):
-            return False
-
-        # Add new files
+        # Collect files, a later file with the same name replaces an earlier one
+        new_files = {}
         added_count = 0
         for file_path in files_to_add:
             if os.path.isfile(file_path):
                 basename = os.path.basename(file_path)
-                shutil.copy2(file_path, os.path.join(work_dir, basename))
+                if len(basename) > 24:
+                    print(f"Warning: Filename '{basename}' exceeds 24 characters, truncating")
+                    basename = basename[:24]
+                new_files[basename] = file_path
                 print(f"Added: {basename}")
                 added_count += 1
             else:
@@ -283,6 +502,21 @@ class IMGTool:
             print("Error: No valid files were added", file=sys.stderr)
             return False
 
+        # Append in place, only rebuild when the directory is full
+        if self._append_in_place(img_file, format_type, entry_count, new_files):
+            print(f"Successfully added {added_count} file(s) to {img_file}")
+            return True
+
+        work_dir = os.path.join(self.temp_dir, 'img_work')
+
+        # Extract existing IMG
+        print("Directory full, extracting existing IMG...")
+        if not self.extract_img(img_file, work_dir, format_type=format_type, entry_count=entry_count):
+            return False
+
+        for basename, file_path in new_files.items():
+            shutil.copy2(file_path, os.path.join(work_dir, basename))
+
         # Rebuild IMG with same format
         print("Rebuilding IMG...")
         format_param = format_type.lower()
@@ -298,48 +532,50 @@ class IMGTool:
             return False
 
         # Detect format
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
-        work_dir = os.path.join(self.temp_dir, 'img_work')
-
-        # Extract existing IMG
-        print("Extracting existing IMG...")
-        if not self.extract_img(img_file, work_dir):
-            return False
-
-        # Remove files
-        removed_count = 0
-        for pattern in files_to_remove:
-            # Handle wildcards
-            matching_files = []
-            for filename in os.listdir(work_dir):
-                if fnmatch.fnmatch(filename, pattern):
-                    matching_files.append(filename)
-
-            if matching_files:
-                for filename in matching_files:
-                    filepath = os.path.join(work_dir, filename)
-                    if os.path.isfile(filepath):
-                        os.remove(filepath)
-                        print(f"Removed: {filename}")
-                        removed_count += 1
-            else:
-                print(f"Warning: File not found: {pattern}")
-
-        if removed_count == 0:
-            print("Error: No files were removed", file=sys.stderr)
-            return False
+        dir_start = 8 if format_type == "VER2" else 0
 
-        # Rebuild IMG with same format
-        print("Rebuilding IMG...")
-        format_param = format_type.lower()
-        if self.create_img(format_param, img_file, work_dir):
-            print(f"Successfully removed {removed_count} file(s) from {img_file}")
-            return True
-        return False
+        # Handle wildcards: all patterns go into one alternation so the file list is
+        # scanned once, each file counts towards the first pattern it matches
+        pattern_re = re.compile('|'.join(f'(?P<p{i}>{fnmatch.translate(pattern)})'
+                                         for i, pattern in enumerate(files_to_remove)))
+        matched_groups = set()
+
+        with open(img_file, 'r+b') as f:
+            _, sizes, names = self._read_directory(f, dir_start, entry_count)
+
+            # Remove files
+            removed_names = set()
+            for filename in sorted({name for name, size in zip(names, sizes) if name and size}):
+                match = pattern_re.match(filename)
+                if match:
+                    matched_groups.add(match.lastgroup)
+                    removed_names.add(filename)
+                    print(f"Removed: {filename}")
+
+            for i, pattern in enumerate(files_to_remove):
+                if f'p{i}' not in matched_groups:
+                    print(f"Warning: File not found: {pattern}")
+
+            if not removed_names:
+                print("Error: No files were removed", file=sys.stderr)
+                return False
+
+            keep = [i for i, name in enumerate(names) if name not in removed_names]
+            if not keep:
+                print("Error: Can't remove every file from the IMG", file=sys.stderr)
+                return False
+
+            # Close the gaps in the directory
+            self._compact_directory(f, dir_start, format_type, len(names), keep)
+
+        print(f"Successfully removed {len(removed_names)} file(s) from {img_file}")
+        print("Run rebuild to reclaim the freed space")
+        return True
 
     def rename_in_img(self, img_file: str, old_name: str, new_name: str) -> bool:
         """Rename file in IMG"""
@@ -353,72 +589,127 @@ class IMGTool:
             return False
 
         # Detect format
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
-        work_dir = os.path.join(self.temp_dir, 'img_work')
+        dir_start = 8 if format_type == "VER2" else 0
 
-        # Extract existing IMG
-        print("Extracting existing IMG...")
-        if not self.extract_img(img_file, work_dir):
-            return False
+        with open(img_file, 'r+b') as f:
+            _, sizes, names = self._read_directory(f, dir_start, entry_count)
+            entry_index = {name: i for i, (name, size) in enumerate(zip(names, sizes)) if name and size}
 
-        old_path = os.path.join(work_dir, old_name)
-        new_path = os.path.join(work_dir, new_name)
+            # Check if old file exists
+            if old_name not in entry_index:
+                print(f"Error: File '{old_name}' not found in archive", file=sys.stderr)
+                return False
 
-        # Check if old file exists
-        if not os.path.isfile(old_path):
-            print(f"Error: File '{old_name}' not found in archive", file=sys.stderr)
-            return False
+            # Check if new name already exists
+            if new_name in entry_index:
+                print(f"Error: File '{new_name}' already exists in archive", file=sys.stderr)
+                return False
 
-        # Check if new name already exists
-        if os.path.isfile(new_path):
-            print(f"Error: File '{new_name}' already exists in archive", file=sys.stderr)
-            return False
+            # Only the 24-byte name field changes, overwrite it in place
+            index = entry_index[old_name]
+            f.seek(dir_start + index * _DIR_ENTRY.size + 8)
+            f.write(new_name.encode('ascii').ljust(24, b'\x00'))
+
+            # Drop the earlier duplicates of the old name, extract would skip them anyway
+            keep = [i for i, name in enumerate(names) if name != old_name or i == index]
+            if len(keep) < len(names):
+                self._compact_directory(f, dir_start, format_type, len(names), keep)
 
-        # Rename file
-        os.rename(old_path, new_path)
         print(f"Renamed: {old_name} -> {new_name}")
+        print(f"Successfully renamed file in {img_file}")
+        return True
 
-        # Rebuild IMG with same format
-        print("Rebuilding IMG...")
-        format_param = format_type.lower()
-        if self.create_img(format_param, img_file, work_dir):
-            print(f"Successfully renamed file in {img_file}")
-            return True
-        return False
+    def _compact_img(self, img_file: str, new_file: str, format_type: str, entry_count: int) -> bool:
+        """Write a defragmented copy of img_file to new_file
+
+        Keeps the same entries an extract + create round trip would (named,
+        non-empty, last duplicate wins) with the directory sorted by name.
+        Data is copied in its current on-disk order so the source is read
+        front to back.
+        """
+        dir_start = 8 if format_type == "VER2" else 0
+
+        with open(img_file, 'rb') as f:
+            img_size = os.fstat(f.fileno()).st_size
+            offsets, sizes, names = self._read_directory(f, dir_start, entry_count)
+
+            last_index = {filename: i for i, filename in enumerate(names) if filename and sizes[i]}
+            if not last_index:
+                print("Error: No files found in IMG", file=sys.stderr)
+                return False
+
+            # Directory slots by name, data placement by current offset
+            slots = sorted(last_index.items())
+            dir_size = dir_start + len(slots) * _DIR_ENTRY.size
+            current_sector = (dir_size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+            placement = {}
+            for filename, i in sorted(slots, key=lambda slot: offsets[slot[1]]):
+                # Entries running past the end of the IMG keep what is actually there
+                byte_offset = offsets[i] * SECTOR_SIZE
+                filesize = max(0, min(sizes[i], img_size - byte_offset))
+                placement[filename] = (current_sector, byte_offset, filesize)
+                current_sector += (filesize + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+            dir_buf = bytearray(len(slots) * _DIR_ENTRY.size)
+            for slot, (filename, _) in enumerate(slots):
+                sector, _, filesize = placement[filename]
+                _DIR_ENTRY.pack_into(dir_buf, slot * _DIR_ENTRY.size, sector, filesize, filename.encode('ascii'))
+
+            # Unbuffered so kernel-side copies and our own writes share one file position
+            with open(new_file, 'wb', buffering=0) as out_f:
+                if format_type == "VER2":
+                    out_f.write(b'VER2' + _U32.pack(len(slots)))
+                out_f.write(dir_buf)
+
+                for sector, byte_offset, filesize in sorted(placement.values()):
+                    out_f.seek(sector * SECTOR_SIZE)
+                    if not _kernel_copy(f.fileno(), out_f.fileno(), filesize, byte_offset):
+                        f.seek(byte_offset)
+                        out_f.write(f.read(filesize))
+
+                # Pad the last file to a sector boundary
+                out_f.truncate(current_sector * SECTOR_SIZE)
+
+        return True
 
     def rebuild_img(self, img_file: str) -> bool:
         """Rebuild/optimize IMG file"""
         # Detect format
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
         print(f"Rebuilding {img_file} (format: {format_type})...")
 
-        work_dir = os.path.join(self.temp_dir, 'img_work')
         backup_file = f"{img_file}.backup.{int(time.time())}"
 
         # Create backup
         shutil.copy2(img_file, backup_file)
         print(f"Backup created: {backup_file}")
 
-        # Extract existing IMG
-        if not self.extract_img(img_file, work_dir):
-            return False
-
         # Get original size
         old_size = os.path.getsize(backup_file)
 
-        # Rebuild IMG with same format
-        format_param = format_type.lower()
-        if not self.create_img(format_param, img_file, work_dir):
+        # Copy entries straight into a compacted new IMG, no extract to disk
+        new_file = f"{img_file}.new"
+        try:
+            if not self._compact_img(img_file, new_file, format_type, entry_count):
+                return False
+        except OSError as e:
+            print(f"Error: Rebuild failed: {e}", file=sys.stderr)
+            if os.path.exists(new_file):
+                os.remove(new_file)
             return False
 
+        os.replace(new_file, img_file)
+
         # Show size comparison
         new_size = os.path.getsize(img_file)
         saved_bytes = old_size - new_size
@@ -442,12 +733,11 @@ class IMGTool:
             return False
 
         # Detect format
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
         if format_type == "INVALID":
             print("Error: Invalid or unsupported IMG file format", file=sys.stderr)
             return False
 
-        entry_count = self.get_entry_count(img_file, format_type)
         dir_start = 8 if format_type == "VER2" else 0
 
         print(f"IMG File: {img_file} (Format: {format_type})")
@@ -460,29 +750,23 @@ class IMGTool:
 
         displayed_count = 0
 
-        with open(img_file, 'rb') as f:
-            for i in range(entry_count):
-                dir_offset = dir_start + i * 32
-                f.seek(dir_offset)
-
-                try:
-                    file_offset = struct.unpack('<I', f.read(4))[0]
-                    file_size = struct.unpack('<I', f.read(4))[0]
-                    filename = f.read(24).rstrip(b'\x00').decode('ascii', errors='ignore')
+        # Compile the filter once rather than matching the shell pattern per entry
+        name_filter = re.compile(fnmatch.translate(filter_pattern)).match if filter_pattern else None
 
-                    # Skip empty entries
-                    if not filename or file_size == 0:
-                        continue
+        with open(img_file, 'rb') as f:
+            offsets, sizes, names = self._read_directory(f, dir_start, entry_count)
 
-                    # Apply filter if specified
-                    if filter_pattern and not fnmatch.fnmatch(filename, filter_pattern):
-                        continue
+        for file_offset, file_size, filename in zip(offsets, sizes, names):
+            # Skip empty entries
+            if not filename or file_size == 0:
+                continue
 
-                    print(f"{filename:<24} {file_size:>10} {file_offset:>10}")
-                    displayed_count += 1
+            # Apply filter if specified
+            if name_filter and not name_filter(filename):
+                continue
 
-                except (struct.error, UnicodeDecodeError):
-                    continue
+            print(f"{filename:<24} {file_size:>10} {file_offset:>10}")
+            displayed_count += 1
 
         if filter_pattern:
             print("-" * 40)
@@ -497,7 +781,7 @@ class IMGTool:
             return False
 
         file_size = os.path.getsize(img_file)
-        format_type = self.detect_img_format(img_file)
+        format_type, entry_count = self._probe_img(img_file)
 
         print("IMG File Information")
         print("=" * 20)
@@ -509,7 +793,6 @@ class IMGTool:
             print("Status: Invalid or unsupported format")
             return False
 
-        entry_count = self.get_entry_count(img_file, format_type)
         header_size = 8 if format_type == "VER2" else 0
 
         dir_size = header_size + entry_count * 32
@@ -523,18 +806,10 @@ class IMGTool:
         print(f"Data starts at: sector {data_start_sector} (byte {data_start_byte})")
 
         # Calculate total data size
-        total_data_size = 0
-        dir_start = header_size
-
         with open(img_file, 'rb') as f:
-            for i in range(entry_count):
-                dir_offset = dir_start + i * 32 + 4  # Skip offset, read size
-                f.seek(dir_offset)
-                try:
-                    file_size = struct.unpack('<I', f.read(4))[0]
-                    total_data_size += file_size
-                except struct.error:
-                    continue
+            _, sizes, _ = self._read_directory(f, header_size, entry_count, with_names=False)
+
+        total_data_size = sum(sizes)
 
         print(f"Total data size: {total_data_size} bytes")
         print(f"Overhead: {file_size - total_data_size} bytes")
@@ -562,6 +837,8 @@ Examples:
 
     parser.add_argument('--version', '-v', action='version',
                        version=f'G-IMGTool version {VERSION}')
+    parser.add_argument('--verbose', action='store_true',
+                       help='Print every entry instead of a progress counter')
 
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
@@ -578,6 +855,8 @@ Examples:
                              help='IMG format version')
     create_parser.add_argument('img_file', help='IMG file to create')
     create_parser.add_argument('input_dir', help='Input directory')
+    create_parser.add_argument('--optimize-layout', action='store_true',
+                             help='Lay out data largest file first (directory stays sorted by name)')
 
     # Add command
     add_parser = subparsers.add_parser('add', aliases=['a'],
@@ -617,43 +896,17 @@ Examples:
     # Parse arguments
     args = parser.parse_args()
 
-    # Validate arguments based on command
-    if args.extract:
-        if len(args.args) != 1:
-            parser.error("--extract requires output directory")
-        output_dir = args.args[0]
-    elif args.create:
-        if len(args.args) != 1:
-            parser.error("--create requires input directory")
-        input_dir = args.args[0]
-        format_type = args.create
-    elif args.add:
-        if len(args.args) < 1:
-            parser.error("--add requires at least one file")
-        files = args.args
-    elif args.delete:
-        if len(args.args) < 1:
-            parser.error("--del requires at least one file")
-        files = args.args
-    elif args.rename:
-        if len(args.args) != 2:
-            parser.error("--rename requires old_name and new_name")
-        old_name, new_name = args.args
-    elif args.list:
-        filter_pattern = args.args[0] if args.args else None
-
-
     if not args.command:
         parser.print_help()
         return 1
 
     # Execute command
-    with IMGTool() as tool:
+    with IMGTool(verbose=args.verbose) as tool:
         try:
             if args.command in ['extract', 'e']:
                 success = tool.extract_img(args.img_file, args.output_dir)
             elif args.command in ['create', 'c']:
-                success = tool.create_img(args.format, args.img_file, args.input_dir)
+                success = tool.create_img(args.format, args.img_file, args.input_dir, args.optimize_layout)
             elif args.command in ['add', 'a']:
                 success = tool.add_multiple_to_img(args.img_file, args.files)
             elif args.command in ['del', 'd']:
@@ -6,9 +6,20 @@ import json
 import argparse
 import subprocess
 import shutil
-import platform
-from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
+import functools
+import shlex
+import glob
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Tuple, Optional, Set, Iterator
+
+# Use orjson for parsing presets when it is installed
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
 
 # Script version
 SCRIPT_VERSION = "0.8"
@@ -16,6 +27,61 @@ SCRIPT_VERSION = "0.8"
 # Default media extensions
 MEDIA_EXTENSIONS = ["mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "m4v", "mpg", "mpeg", "ts"]
 
+# Handbrake preset values and their FFmpeg equivalents
+VCODEC_MAP = {'x265': 'libx265', 'x264': 'libx264'}
+MIXDOWN_MAP = {'5point1': '-ac 6', 'stereo': '-ac 2', 'mono': '-ac 1'}
+CONTAINER_MAP = {'av_mkv': 'mkv', 'av_mp4': 'mp4'}
+
+# ffmpeg muxer for each output format, used when the extension doesn't match it
+FORMAT_MUXERS = {'mkv': 'matroska', 'mp4': 'mp4'}
+
+# Encoder threads each parallel ffmpeg job should get when picking --jobs automatically
+THREADS_PER_JOB = 4
+
+# Hardware encoders replacing each software encoder, in --hwaccel auto preference order
+HW_ENCODERS = {
+    'libx265': {'nvenc': 'hevc_nvenc', 'qsv': 'hevc_qsv', 'vaapi': 'hevc_vaapi', 'amf': 'hevc_amf'},
+    'libx264': {'nvenc': 'h264_nvenc', 'qsv': 'h264_qsv', 'vaapi': 'h264_vaapi', 'amf': 'h264_amf'},
+}
+HWACCEL_CHOICES = ['auto', 'nvenc', 'qsv', 'vaapi', 'amf', 'none']
+
+# x264/x265 preset names and the closest preset of each hardware encoder type;
+# VAAPI encoders have no -preset option at all
+HW_PRESET_MAP = {
+    'nvenc': {
+        'ultrafast': 'p1', 'superfast': 'p1', 'veryfast': 'p2', 'faster': 'p3', 'fast': 'p3',
+        'medium': 'p4', 'slow': 'p5', 'slower': 'p6', 'veryslow': 'p7', 'placebo': 'p7',
+    },
+    'qsv': {
+        'ultrafast': 'veryfast', 'superfast': 'veryfast', 'veryfast': 'veryfast', 'faster': 'faster',
+        'fast': 'fast', 'medium': 'medium', 'slow': 'slow', 'slower': 'slower', 'veryslow': 'veryslow',
+        'placebo': 'veryslow',
+    },
+    'amf': {
+        'ultrafast': 'speed', 'superfast': 'speed', 'veryfast': 'speed', 'faster': 'speed', 'fast': 'speed',
+        'medium': 'balanced', 'slow': 'quality', 'slower': 'quality', 'veryslow': 'quality', 'placebo': 'quality',
+    },
+}
+
+# Codec produced by each software encoder, hardware encoders are named <codec>_<api>
+ENCODER_CODECS = {'libx265': 'hevc', 'libx264': 'h264', 'libsvtav1': 'av1'}
+
+# Output extensions whose muxer supports -movflags +faststart
+FASTSTART_EXTENSIONS = {'.mp4', '.m4v', '.mov'}
+
+# x264/x265 preset names and the closest SVT-AV1 preset (0 = slowest, 12 = fastest)
+SVTAV1_PRESET_MAP = {
+    'ultrafast': '12', 'superfast': '11', 'veryfast': '10', 'faster': '9', 'fast': '8',
+    'medium': '6', 'slow': '4', 'slower': '3', 'veryslow': '2', 'placebo': '1',
+}
+SVTAV1_PARAMS = 'tune=0:enable-overlays=1'
+
+# Render node used for VAAPI encoding
+VAAPI_DEVICE = '/dev/dri/renderD128'
+
+# Null output device for the first pass of two-pass encoding
+NULL_DEVICE = 'NUL' if os.name == 'nt' else '/dev/null'
+
 
 def show_usage():
     """Display usage information and exit"""
@@ -28,8 +94,13 @@ def show_usage():
     print("  -i, --input-dir    Specify input directory (default: same as JSON file)")
     print("  -o, --output-dir   Specify output directory (default: input_dir/converted)")
     print("  -m, --force-m4v    Force output extension to .m4v regardless of container")
+    print("  -j, --jobs=N       Convert N files in parallel (default: one job per 4 CPUs)")
     print("  -u, --no-underscore-replace  Don't replace underscores with spaces in output filenames")
     print("  --ignore-flag=X    Set custom ignore flag file (default: .noconvert)")
+    print("  --hwaccel=X        Use a hardware encoder: auto, nvenc, qsv, vaapi, amf, none (default: none)")
+    print("  --prefer-svtav1    Encode x265 presets with SVT-AV1 when no hardware encoder is used")
+    print("  --allow-remux      Copy streams instead of re-encoding files already in the target video codec")
+    print("  --multi-output=X   Also encode each file with preset X in the same ffmpeg run (repeatable)")
     print("  --verbose          Show verbose output and ffmpeg logs")
     print("  -v, --version      Show version:", SCRIPT_VERSION)
     print("  -l, --log=FILE     Send output to log file (default: script_output.log)")
@@ -51,11 +122,17 @@ def parse_arguments():
     parser.add_argument('-d', '--dry-run', action='store_true', help='Show what would be done without actually doing it')
     parser.add_argument('-p', '--show-preset', action='store_true', help='Show only the ffmpeg equivalent of the preset')
     parser.add_argument('-m', '--force-m4v', action='store_true', help='Force output extension to .m4v')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of files to convert in parallel')
     parser.add_argument('-u', '--no-underscore-replace', action='store_true', help='Don\'t replace underscores with spaces')
     parser.add_argument('--verbose', action='store_true', help='Show verbose output and ffmpeg logs')
     parser.add_argument('-i', '--input-dir', help='Specify input directory')
     parser.add_argument('-o', '--output-dir', help='Specify output directory')
     parser.add_argument('--ignore-flag', default='.noconvert', help='Set custom ignore flag file')
+    parser.add_argument('--hwaccel', choices=HWACCEL_CHOICES, default='none', help='Use a hardware encoder')
+    parser.add_argument('--prefer-svtav1', action='store_true', help='Encode x265 presets with SVT-AV1')
+    parser.add_argument('--allow-remux', action='store_true', help='Copy streams of files already in the target codec')
+    parser.add_argument('--multi-output', action='append', default=[], metavar='JSON_FILE',
+                        help='Also encode each file with this preset in the same ffmpeg run')
     parser.add_argument('-v', '--version', action='store_true', help='Show version')
     parser.add_argument('-l', '--log', help='Send output to log file')
     parser.add_argument('-h', '--help', action='store_true', help='Show this help message')
@@ -72,14 +149,19 @@ def parse_arguments():
     if not args.json_file:
         show_usage()
 
+    if args.jobs is not None and args.jobs < 1:
+        print("Error: --jobs must be at least 1.", file=sys.stderr)
+        sys.exit(1)
+
     return args
 
 
 def load_json_preset(json_file: str) -> Dict[str, Any]:
     """Load and parse the JSON preset file"""
     try:
-        with open(json_file, 'r') as f:
-            data = json.load(f)
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError
+        with open(json_file, 'rb') as f:
+            data = _json_loads(f.read())
         return data
     except FileNotFoundError:
         print(f"Error: JSON file '{json_file}' does not exist.", file=sys.stderr)
@@ -117,60 +199,143 @@ def extract_preset_settings(preset_data: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def convert_to_ffmpeg_params(settings: Dict[str, Any]) -> Dict[str, Any]:
+def get_available_encoders() -> Set[str]:
+    """Get the names of the encoders the installed ffmpeg supports"""
+    cmd = ["ffmpeg", "-hide_banner", "-encoders"]
+    try:
+        output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    except OSError:
+        return set()
+
+    # Encoder lines look like " V....D hevc_nvenc  NVIDIA NVENC hevc encoder"
+    # and follow a legend that ends with a " ------" line
+    encoders = set()
+    _, _, listing = output.partition('------')
+    for line in listing.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+    return encoders
+
+
+def select_hw_encoder(vcodec: str, hwaccel: str, encoders: Set[str]) -> Tuple[str, str]:
+    """Pick the hardware encoder for a software encoder, returning (encoder, hwaccel type)"""
+    candidates = HW_ENCODERS.get(vcodec, {})
+    kinds = list(candidates) if hwaccel == 'auto' else [hwaccel]
+
+    for kind in kinds:
+        encoder = candidates.get(kind)
+        if encoder and encoder in encoders:
+            return encoder, kind
+
+    if hwaccel != 'auto':
+        print(f"Warning: No {hwaccel} encoder available for {vcodec}, using software encoding")
+    return vcodec, ''
+
+
+def convert_to_ffmpeg_params(settings: Dict[str, Any], hwaccel: str = 'none',
+                             encoders: Optional[Set[str]] = None, prefer_svtav1: bool = False) -> Dict[str, Any]:
     """Convert Handbrake settings to FFmpeg parameters"""
     result = {}
 
     # Convert video encoder
-    if settings['video_encoder'] == 'x265':
-        result['vcodec'] = 'libx265'
-    elif settings['video_encoder'] == 'x264':
-        result['vcodec'] = 'libx264'
-    else:
-        result['vcodec'] = settings['video_encoder']
+    result['vcodec'] = VCODEC_MAP.get(settings['video_encoder'], settings['video_encoder'])
+
+    # Swap in a hardware encoder if one was requested and ffmpeg has it
+    hw_type = ''
+    if hwaccel != 'none':
+        result['vcodec'], hw_type = select_hw_encoder(result['vcodec'], hwaccel, encoders or set())
+
+    # SVT-AV1 is a much faster software encoder than x265 at similar quality
+    use_svtav1 = False
+    if prefer_svtav1 and result['vcodec'] == 'libx265':
+        if 'libsvtav1' in (encoders or set()):
+            result['vcodec'] = 'libsvtav1'
+            use_svtav1 = True
+        else:
+            print("Warning: libsvtav1 is not available, using libx265")
 
     # Convert audio encoder
     if settings['audio_encoder'].startswith('copy:'):
-        audio_codec = settings['audio_encoder'].split(':', 1)[1]
         result['acodec'] = '-c:a copy'
     else:
         result['acodec'] = f"-c:a aac -b:a {settings['audio_bitrate']}k"
 
     # Handle audio mixdown
-    if settings['audio_mixdown'] == '5point1':
-        result['audio_channels'] = '-ac 6'
-    elif settings['audio_mixdown'] == 'stereo':
-        result['audio_channels'] = '-ac 2'
-    elif settings['audio_mixdown'] == 'mono':
-        result['audio_channels'] = '-ac 1'
-    else:
-        result['audio_channels'] = ''
+    result['audio_channels'] = MIXDOWN_MAP.get(settings['audio_mixdown'], '')
 
     # Video quality settings
     if settings['video_quality_type'] == '2':
         # CRF mode
         result['quality'] = f"-crf {settings['video_quality']}"
+
+        # Hardware encoders have no -crf, use their constant quality modes instead
+        if hw_type == 'nvenc':
+            result['quality'] = f"-cq {settings['video_quality']} -b:v 0"
+        elif hw_type == 'qsv':
+            result['quality'] = f"-global_quality {settings['video_quality']}"
+        elif hw_type == 'vaapi':
+            result['quality'] = f"-qp {settings['video_quality']}"
+        elif hw_type == 'amf':
+            result['quality'] = f"-rc cqp -qp_i {settings['video_quality']} -qp_p {settings['video_quality']}"
     else:
         # Bitrate mode
         result['quality'] = f"-b:v {settings['video_bitrate']}k"
 
-    # Convert container format
-    if settings['container'] == 'av_mkv':
-        result['format'] = 'mkv'
-    elif settings['container'] == 'av_mp4':
-        result['format'] = 'mp4'
-    else:
-        result['format'] = 'mkv'  # Default to MKV
+    # Convert container format, defaulting to MKV
+    result['format'] = CONTAINER_MAP.get(settings['container'], 'mkv')
 
     result['preset'] = settings['video_preset']
     result['profile'] = settings['video_profile']
     result['framerate'] = settings['video_framerate']
     result['resolution'] = f"{settings['picture_width']}x{settings['picture_height']}"
     result['multipass'] = settings['video_multipass']
+    result['codec_options'] = ''
+
+    # SVT-AV1 uses numeric presets, has no x265 profiles and no -pass support
+    if use_svtav1:
+        result['preset'] = SVTAV1_PRESET_MAP.get(result['preset'], result['preset'])
+        result['profile'] = ''
+        result['codec_options'] = f"-svtav1-params {SVTAV1_PARAMS}"
+        result['multipass'] = False
+
+    # Input flags for hardware decoding; frames come back to system memory so
+    # the software scaler behind -s still works
+    result['hwaccel'] = ''
+    result['video_filter'] = ''
+    if hw_type == 'nvenc':
+        result['hwaccel'] = '-hwaccel cuda'
+    elif hw_type == 'qsv':
+        result['hwaccel'] = '-hwaccel qsv'
+    elif hw_type == 'vaapi':
+        # VAAPI encoders only take GPU frames: scale first, then upload
+        result['hwaccel'] = f"-vaapi_device {VAAPI_DEVICE}"
+        result['video_filter'] = (f"scale={settings['picture_width']}:{settings['picture_height']},"
+                                  "format=nv12,hwupload")
+
+    # Hardware encoders use their own preset names (unknown ones are dropped) and
+    # do their own lookahead, so a separate first pass gains nothing
+    if hw_type:
+        result['preset'] = HW_PRESET_MAP.get(hw_type, {}).get(result['preset'], '')
+        result['multipass'] = False
 
     return result
 
 
+def merge_hwaccel_args(hwaccels: List[str]) -> Optional[str]:
+    """Combine the input-side hardware flags of presets sharing one ffmpeg input
+
+    Returns None when two presets set the same option to different values.
+    """
+    merged = {}
+    for hwaccel in hwaccels:
+        parts = hwaccel.split()
+        for option, value in zip(parts[::2], parts[1::2]):
+            if merged.setdefault(option, value) != value:
+                return None
+    return " ".join(f"{option} {value}" for option, value in merged.items())
+
+
 def show_preset(ffmpeg_params: Dict[str, Any], output_format: str, analyze_duration: int, probe_size: int):
     """Display the FFmpeg equivalent of the preset"""
     print("============================================")
@@ -178,8 +343,13 @@ def show_preset(ffmpeg_params: Dict[str, Any], output_format: str, analyze_durat
     print("FFmpeg Equivalent Parameters:")
     print("============================================")
     print(f"Video codec:      -c:v {ffmpeg_params['vcodec']}")
+
+    if ffmpeg_params.get('hwaccel'):
+        print(f"Hardware:         {ffmpeg_params['hwaccel']}")
+
     print(f"Quality:          {ffmpeg_params['quality']}")
-    print(f"Preset:           -preset {ffmpeg_params['preset']}")
+    if ffmpeg_params['preset']:
+        print(f"Preset:           -preset {ffmpeg_params['preset']}")
 
     if ffmpeg_params['framerate'] != "auto" and ffmpeg_params['framerate']:
         print(f"Framerate:        -r {ffmpeg_params['framerate']}")
@@ -201,19 +371,23 @@ def show_preset(ffmpeg_params: Dict[str, Any], output_format: str, analyze_durat
     print(f"Probe size:       {probe_size}")
     print("============================================")
     print("Example usage:")
+    preset_arg = f"-preset {ffmpeg_params['preset']} " if ffmpeg_params['preset'] else ""
     print(f"ffmpeg -analyzeduration {analyze_duration} -probesize {probe_size} -i input.mp4 "
-          f"-c:v {ffmpeg_params['vcodec']} {ffmpeg_params['quality']} -preset {ffmpeg_params['preset']} "
+          f"-c:v {ffmpeg_params['vcodec']} {ffmpeg_params['quality']} {preset_arg}"
           f"-s {ffmpeg_params['resolution']} {ffmpeg_params['acodec']} {ffmpeg_params['audio_channels']} "
           f"output.{output_format}")
     print("============================================")
 
 
+@functools.lru_cache(maxsize=None)
+def _dir_has_ignore(dir_path: str, ignore_flag: str) -> bool:
+    """Check once per directory whether it contains the ignore flag file"""
+    return os.path.isfile(os.path.join(dir_path, ignore_flag))
+
+
 def should_ignore_file(file_path: str, ignore_flag: str) -> bool:
     """Check if a file should be ignored based on ignore flag"""
-    dir_path = os.path.dirname(file_path)
-    if os.path.isfile(os.path.join(dir_path, ignore_flag)):
-        return True
-    return False
+    return _dir_has_ignore(os.path.dirname(file_path), ignore_flag)
 
 
 def format_filename(basename: str, replace_underscores: bool) -> str:
@@ -223,107 +397,213 @@ def format_filename(basename: str, replace_underscores: bool) -> str:
     return basename
 
 
-def check_file_access(file_path: str) -> bool:
-    """Check if a file exists and is writable"""
-    dir_path = os.path.dirname(file_path)
-
+def check_dir_access(dir_path: str) -> bool:
+    """Check if a directory exists and is writable"""
     if not os.path.isdir(dir_path):
         print(f"Error: Output directory '{dir_path}' does not exist.")
         return False
 
+    if not os.access(dir_path, os.W_OK):
+        print(f"Error: Output directory '{dir_path}' is not writable.")
+        return False
+
+    return True
+
+
+def check_file_access(file_path: str) -> bool:
+    """Check if an existing file is writable"""
     if os.path.isfile(file_path) and not os.access(file_path, os.W_OK):
         print(f"Error: Output file '{file_path}' exists but is not writable.")
         return False
 
-    if not os.access(dir_path, os.W_OK):
-        print(f"Error: Output directory '{dir_path}' is not writable.")
-        return False
+    return True
+
+
+def prepare_output_dir(output_subdir: str, execute: bool, dry_run: bool) -> bool:
+    """Create an output subdirectory if needed and check it can be written to"""
+    if not os.path.isdir(output_subdir):
+        if not dry_run:
+            print(f"Creating output directory: {output_subdir}")
+            try:
+                os.makedirs(output_subdir, exist_ok=True)
+            except OSError as e:
+                print(f"Error creating directory: {output_subdir}: {e}")
+                return False
+        else:
+            print(f"[DRY RUN] Would create directory: {output_subdir}")
+
+    if not dry_run and execute:
+        return check_dir_access(output_subdir)
 
     return True
 
 
-def get_null_device() -> str:
-    """Get the appropriate null device for the current platform"""
-    if platform.system() == 'Windows':
-        return 'NUL'
-    return '/dev/null'
+# Compiled command parts: (before the input, before the output, before the first pass output)
+FFmpegTemplate = Tuple[List[str], List[str], List[str]]
 
+# Output options dropped from the first pass of a two-pass encode, with their values
+AUDIO_OPTIONS = {'-c:a', '-b:a', '-ac'}
 
-def build_ffmpeg_command(input_file: str, output_file: str, ffmpeg_params: Dict[str, Any],
-                         analyze_duration: int, probe_size: int, verbose: bool) -> List[str]:
-    """Build FFmpeg command with proper parameter handling"""
-    # Base command with proper escaping and extended analysis parameters
-    cmd = [
+
+def compile_ffmpeg_template(ffmpeg_params: Dict[str, Any], analyze_duration: int,
+                            verbose: bool, threads: int = 0) -> FFmpegTemplate:
+    """Build the per-batch parts of the FFmpeg command once
+
+    Returns the arguments that go before the input file, those that go
+    between the input and the output file, and the variant of the latter
+    that copies audio and subtitles, used for the first pass of a two-pass
+    encode. The probe size
+    depends on the input file and is added per file.
+    """
+    # Base command with extended analysis parameters
+    input_args = [
         "ffmpeg",
         "-analyzeduration", str(analyze_duration),
-        "-probesize", str(probe_size),
-        "-i", input_file,
-        "-c:v", ffmpeg_params['vcodec'],
     ]
 
+    # Add hardware decoding/device flags, these must come before the input
+    if ffmpeg_params.get('hwaccel'):
+        input_args.extend(ffmpeg_params['hwaccel'].split())
+
+    output_args = ["-c:v", ffmpeg_params['vcodec']]
+
     # Add quality parameter (split to handle multiple arguments)
     quality_parts = ffmpeg_params['quality'].split()
-    cmd.extend(quality_parts)
+    output_args.extend(quality_parts)
 
-    # Add preset
-    cmd.extend(["-preset", ffmpeg_params['preset']])
+    # Add preset if the encoder takes one
+    if ffmpeg_params['preset']:
+        output_args.extend(["-preset", ffmpeg_params['preset']])
 
     # Add framerate if specified
     if ffmpeg_params['framerate'] != "auto" and ffmpeg_params['framerate']:
-        cmd.extend(["-r", ffmpeg_params['framerate']])
+        output_args.extend(["-r", ffmpeg_params['framerate']])
 
-    # Add resolution
-    cmd.extend(["-s", ffmpeg_params['resolution']])
+    # Add resolution (VAAPI scales inside its filter chain instead)
+    if ffmpeg_params.get('video_filter'):
+        output_args.extend(["-vf", ffmpeg_params['video_filter']])
+    else:
+        output_args.extend(["-s", ffmpeg_params['resolution']])
 
     # Add audio settings (split to handle multiple arguments)
     audio_parts = ffmpeg_params['acodec'].split()
-    cmd.extend(audio_parts)
+    output_args.extend(audio_parts)
 
     if ffmpeg_params['audio_channels']:
         audio_channel_parts = ffmpeg_params['audio_channels'].split()
-        cmd.extend(audio_channel_parts)
+        output_args.extend(audio_channel_parts)
 
     # Add profile if specified
     if ffmpeg_params['profile'] != "auto" and ffmpeg_params['profile']:
-        cmd.extend(["-profile:v", ffmpeg_params['profile']])
+        output_args.extend(["-profile:v", ffmpeg_params['profile']])
+
+    # Add encoder specific options
+    if ffmpeg_params.get('codec_options'):
+        output_args.extend(ffmpeg_params['codec_options'].split())
+
+    # Limit encoder threads when several ffmpeg jobs share the CPUs
+    if threads:
+        output_args.extend(["-threads", str(threads)])
 
     # Add verbosity level
     if not verbose:
-        cmd.extend(["-v", "error", "-stats"])
+        output_args.extend(["-v", "error", "-stats"])
 
     # Always copy all streams from input
-    cmd.extend(["-map", "0"])
+    output_args.extend(["-map", "0"])
+
+    # The first pass only gathers video statistics, so copy audio and subtitles
+    # instead of encoding them. The stream mapping must stay the same as in the
+    # second pass, ffmpeg names the pass logs after the output stream index.
+    first_pass_args = []
+    args = iter(output_args)
+    for arg in args:
+        if arg in AUDIO_OPTIONS:
+            next(args)
+        else:
+            first_pass_args.append(arg)
+    first_pass_args.extend(["-c:a", "copy", "-c:s", "copy"])
 
-    # Add output file
-    cmd.append(output_file)
+    return input_args, output_args, first_pass_args
 
-    return cmd
 
+def get_probe_size(input_file: str, probe_size: int) -> int:
+    """Limit the probe size to the size of the input file"""
+    try:
+        file_size = os.path.getsize(input_file)
+    except OSError:
+        return probe_size
+    # ffmpeg rejects probe sizes below 32 bytes
+    return max(32, min(file_size, probe_size))
 
-def build_multipass_commands(input_file: str, output_file: str, ffmpeg_params: Dict[str, Any],
-                           analyze_duration: int, probe_size: int, verbose: bool) -> List[List[str]]:
-    """Build FFmpeg commands for two-pass encoding"""
-    # Get appropriate null device
-    null_device = get_null_device()
 
-    # First pass command - write to null device with specified format
-    pass1_cmd = build_ffmpeg_command(input_file, null_device, ffmpeg_params,
-                                     analyze_duration, probe_size, verbose)
+def build_ffmpeg_command(template: FFmpegTemplate, input_file: str, output_file: str,
+                         probe_size: int) -> List[str]:
+    """Build the FFmpeg command for one file from the compiled template"""
+    input_args, output_args, _ = template
+    return [*input_args, "-probesize", str(probe_size), "-i", input_file, *output_args, output_file]
+
+
+def get_passlog_file(output_file: str) -> str:
+    """Temporary prefix for the two-pass statistics of the job writing output_file
+
+    Named after a hash of the output path, so it is unique per job and free of
+    characters from the media filename that ffmpeg or the encoders would parse.
+    """
+    digest = hashlib.sha256(os.fsencode(output_file)).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), f"hb-ffmpeg-conv-{digest}")
+
 
-    # Need to fix the first pass command:
-    # For first pass, replace the output file with -f null to explicitly specify the format
-    # and avoid the need for a valid output file extension
-    pass1_cmd = pass1_cmd[:-1]  # Remove the last element (output file)
-    pass1_cmd.extend(["-pass", "1", "-f", "null", null_device])
+def build_passlog_args(vcodec: str, passlog_file: str) -> List[str]:
+    """Build the options that keep a two-pass job's statistics in its own files"""
+    args = ["-passlogfile", passlog_file]
 
-    # Second pass command
-    pass2_cmd = build_ffmpeg_command(input_file, output_file, ffmpeg_params,
-                                    analyze_duration, probe_size, verbose)
-    pass2_cmd.extend(["-pass", "2"])
+    # x264 and x265 write their own stats files, by default into the working
+    # directory shared by all parallel jobs. Their -params values are split on
+    # ':' and unquoted, so escape the path (the temp dir may be C:\...)
+    stats_file = passlog_file.replace('\\', '\\\\').replace(':', '\\:').replace("'", "\\'")
+    if vcodec == 'libx264':
+        args.extend(["-x264-params", f"stats={stats_file}.x264.log"])
+    elif vcodec == 'libx265':
+        args.extend(["-x265-params", f"stats={stats_file}.x265.log"])
+
+    return args
+
+
+def build_multipass_commands(template: FFmpegTemplate, input_file: str, output_file: str,
+                             probe_size: int, passlog_args: List[str]) -> List[List[str]]:
+    """Build FFmpeg commands for two-pass encoding"""
+    input_args, output_args, first_pass_args = template
+    input_args = [*input_args, "-probesize", str(probe_size)]
+
+    # First pass command - video statistics only, written to the null device with -f null to
+    # explicitly specify the format and avoid the need for a valid output file extension
+    pass1_cmd = [*input_args, "-i", input_file, *first_pass_args, *passlog_args,
+                 "-pass", "1", "-f", "null", NULL_DEVICE]
+
+    # Second pass command - output options must precede the output file,
+    # ffmpeg ignores trailing options
+    pass2_cmd = [*input_args, "-i", input_file, *output_args, *passlog_args, "-pass", "2", output_file]
 
     return [pass1_cmd, pass2_cmd]
 
 
+def build_remux_command(input_file: str, output_file: str, verbose: bool) -> List[str]:
+    """Build FFmpeg command that copies all streams into the output container"""
+    cmd = ["ffmpeg", "-i", input_file, "-c", "copy", "-map", "0"]
+
+    # Add verbosity level
+    if not verbose:
+        cmd.extend(["-v", "error", "-stats"])
+
+    # Put the index at the front of MP4 style files
+    if os.path.splitext(output_file)[1].lower() in FASTSTART_EXTENSIONS:
+        cmd.extend(["-movflags", "+faststart"])
+
+    cmd.append(output_file)
+    return cmd
+
+
 def rename_to_m4v(file_path: str, dry_run: bool) -> bool:
     """Rename a file from original format to m4v"""
     m4v_path = os.path.splitext(file_path)[0] + ".m4v"
@@ -333,16 +613,27 @@ def rename_to_m4v(file_path: str, dry_run: bool) -> bool:
         return True
 
     print(f"Renaming {file_path} to {m4v_path}")
-    if os.path.isfile(file_path):
-        try:
-            os.rename(file_path, m4v_path)
-            return True
-        except OSError as e:
-            print(f"Error renaming file to .m4v: {e}")
-            return False
-    else:
+    try:
+        # os.replace also overwrites an existing .m4v on Windows
+        os.replace(file_path, m4v_path)
+        return True
+    except FileNotFoundError:
         print(f"Error: File {file_path} not found for renaming")
         return False
+    except OSError as e:
+        print(f"Error renaming file to .m4v: {e}")
+        return False
+
+
+def get_video_codec(file_path: str) -> str:
+    """Get the codec name of the first video stream using ffprobe"""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+           "-show_entries", "stream=codec_name", "-of", "csv=p=0", file_path]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True)
+    except OSError:
+        return ''
+    return result.stdout.strip()
 
 
 def get_file_info(file_path: str):
@@ -352,40 +643,52 @@ def get_file_info(file_path: str):
     subprocess.run(cmd)
 
 
-def find_media_files(directory: str, recursive: bool, extensions: List[str]) -> List[str]:
-    """Find media files in the specified directory"""
-    result = []
+def find_media_files(directory: str, recursive: bool, extensions: List[str],
+                     exclude_dir: Optional[str] = None) -> Iterator[str]:
+    """Find media files in the specified directory, yielding them as they are found.
+    exclude_dir is not descended into, so files converted into it are never picked up."""
+    ext_set = frozenset(ext.lower() for ext in extensions)
 
     if recursive:
-        for root, _, files in os.walk(directory):
+        exclude_real = os.path.realpath(exclude_dir) if exclude_dir else None
+        for root, dirs, files in os.walk(directory):
+            # The walk runs alongside the conversions, so prune the output directory
+            if exclude_real:
+                dirs[:] = [d for d in dirs
+                           if os.path.realpath(os.path.join(root, d)) != exclude_real]
             for file in files:
-                if any(file.lower().endswith(f".{ext}") for ext in extensions):
-                    result.append(os.path.join(root, file))
+                _, dot, ext = file.rpartition('.')
+                if dot and ext.lower() in ext_set:
+                    yield os.path.join(root, file)
     else:
-        for item in os.listdir(directory):
-            full_path = os.path.join(directory, item)
-            if os.path.isfile(full_path) and any(item.lower().endswith(f".{ext}") for ext in extensions):
-                result.append(full_path)
-
-    return result
+        # scandir knows the entry type from the directory listing, no stat per file
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                _, dot, ext = entry.name.rpartition('.')
+                if dot and ext.lower() in ext_set and entry.is_file():
+                    yield entry.path
 
 
-def process_file(
+def prepare_file(
     input_file: str,
     media_dir: str,
     output_dir: str,
-    ffmpeg_params: Dict[str, Any],
+    template: FFmpegTemplate,
+    is_multipass: bool,
+    vcodec: str,
+    probe_size: int,
     original_format: str,
     output_format: str,
     force_m4v: bool,
     execute: bool,
     dry_run: bool,
     replace_underscores: bool,
-    analyze_duration: int,
-    probe_size: int,
-    verbose: bool
-) -> int:
-    """Process a media file"""
+    output_dirs: Dict[str, bool],
+    remux_codec: str = '',
+    verbose: bool = False,
+    extra_outputs: Optional[List[Tuple[str, str, List[str]]]] = None
+) -> Optional[Dict[str, Any]]:
+    """Set up the output location and build the ffmpeg command(s) for a media file"""
     # Calculate relative path to preserve directory structure
     rel_path = os.path.relpath(input_file, media_dir)
 
@@ -410,82 +713,135 @@ def process_file(
 
     output_file = os.path.join(output_subdir, f"{formatted_basename}.{actual_format}")
 
-    # Create output subdirectory if needed
-    if not os.path.isdir(output_subdir):
-        if not dry_run:
-            print(f"Creating output directory: {output_subdir}")
-            try:
-                os.makedirs(output_subdir, exist_ok=True)
-            except OSError as e:
-                print(f"Error creating directory: {output_subdir}: {e}")
-                return 1
-        else:
-            print(f"[DRY RUN] Would create directory: {output_subdir}")
+    # Outputs of the extra presets, named after their preset file. These are
+    # written as .m4v directly with an explicit muxer instead of being renamed.
+    extra_files = []
+    extra_args = []
+    for preset_tag, extra_format, output_args in extra_outputs or []:
+        if force_m4v:
+            output_args = [*output_args, "-f", FORMAT_MUXERS.get(extra_format, extra_format)]
+            extra_format = "m4v"
+        extra_file = os.path.join(output_subdir, f"{formatted_basename}-{preset_tag}.{extra_format}")
+        extra_files.append(extra_file)
+        extra_args.extend([*output_args, extra_file])
+
+    # Create and check each output subdirectory only once, output_dirs
+    # remembers the result for the other files going there
+    if output_subdir not in output_dirs:
+        output_dirs[output_subdir] = prepare_output_dir(output_subdir, execute, dry_run)
 
     # Check if output file location is valid and writable
-    if not dry_run and execute:
-        if not check_file_access(output_file):
-            print(f"Skipping {input_file} due to output file access issues.")
-            return 1
+    if not output_dirs[output_subdir] or (
+            not dry_run and execute and not all(map(check_file_access, [output_file, *extra_files]))):
+        print(f"Skipping {input_file} due to output file access issues.")
+        return None
+
+    # Probing never needs to read more than the whole file
+    probe_size = get_probe_size(input_file, probe_size)
+
+    # Build ffmpeg command(s), a file already in the target codec only needs remuxing.
+    # Each two-pass job keeps its statistics in its own temporary files.
+    passlog_file = ''
+    if remux_codec and get_video_codec(input_file) == remux_codec:
+        ffmpeg_cmds = [build_remux_command(input_file, output_file, verbose)]
+    elif is_multipass:
+        passlog_file = get_passlog_file(output_file)
+        ffmpeg_cmds = build_multipass_commands(template, input_file, output_file, probe_size,
+                                               build_passlog_args(vcodec, passlog_file))
+    else:
+        ffmpeg_cmds = [build_ffmpeg_command(template, input_file, output_file, probe_size)]
 
-    # Determine if multipass is needed
-    is_multipass = ffmpeg_params['multipass'] and ffmpeg_params.get('video_quality_type') != '2'
+    # The extra outputs share the decode of the command writing the main
+    # output; they are always single-pass
+    ffmpeg_cmds[-1].extend(extra_args)
 
-    # Build ffmpeg command(s)
-    if is_multipass:
-        ffmpeg_cmds = build_multipass_commands(
-            input_file, output_file, ffmpeg_params, analyze_duration, probe_size, verbose
-        )
-        ffmpeg_cmd_str = " && ".join([" ".join(map(lambda x: f'"{x}"' if ' ' in str(x) else str(x), cmd)) for cmd in ffmpeg_cmds])
-    else:
-        ffmpeg_cmd = build_ffmpeg_command(
-            input_file, output_file, ffmpeg_params, analyze_duration, probe_size, verbose
-        )
-        ffmpeg_cmd_str = " ".join(map(lambda x: f'"{x}"' if ' ' in str(x) else str(x), ffmpeg_cmd))
+    return {
+        'input_file': input_file,
+        'output_file': output_file,
+        'extra_files': extra_files,
+        'actual_format': actual_format,
+        'commands': ffmpeg_cmds,
+        'passlog_file': passlog_file,
+    }
+
+
+def format_commands(ffmpeg_cmds: List[List[str]]) -> str:
+    """Format ffmpeg command(s) as a shell command line for display"""
+    return " && ".join(shlex.join(cmd) for cmd in ffmpeg_cmds)
+
+
+def show_job(job: Dict[str, Any], force_m4v: bool, dry_run: bool):
+    """Print the command(s) a prepared job would run"""
+    output_file = job['output_file']
 
     if dry_run:
         print(f"[DRY RUN] Would execute:")
-        print(ffmpeg_cmd_str)
+        print(format_commands(job['commands']))
         if force_m4v:
             m4v_output = os.path.splitext(output_file)[0] + ".m4v"
             print(f"[DRY RUN] Would rename {output_file} to {m4v_output}")
-    elif execute:
-        print(f"Processing: {input_file}")
-        print(f"Output: {output_file}")
-        print(f"Command: {ffmpeg_cmd_str}")
+    else:
+        print(f"Generated command for {job['input_file']}:")
+        print(format_commands(job['commands']))
+        if force_m4v:
+            print(f"Note: If executed, the file will be converted to {job['actual_format']} then renamed to .m4v")
 
-        # Execute ffmpeg command(s)
-        try:
-            if is_multipass:
-                # For multipass, run commands sequentially
-                for i, cmd in enumerate(ffmpeg_cmds, 1):
-                    print(f"Running pass {i} of {len(ffmpeg_cmds)}...")
-                    result = subprocess.run(cmd, check=True)
-            else:
-                # For single pass
-                result = subprocess.run(ffmpeg_cmd, check=True)
-
-            print("Conversion successful")
-
-            # If successful and force_m4v is enabled, rename to .m4v
-            if force_m4v:
-                if not rename_to_m4v(output_file, dry_run):
-                    print("Warning: Failed to rename file to .m4v")
-
-            return 0
-
-        except subprocess.CalledProcessError as e:
-            print(f"Error: FFmpeg command failed with return code {e.returncode}")
+
+def run_job(job: Dict[str, Any], force_m4v: bool, verbose: bool) -> int:
+    """Run the ffmpeg command(s) of a prepared job"""
+    input_file = job['input_file']
+    output_file = job['output_file']
+    ffmpeg_cmds = job['commands']
+
+    print(f"Processing: {input_file}")
+    print(f"Output: {output_file}")
+    for extra_file in job['extra_files']:
+        print(f"Output: {extra_file}")
+    if verbose:
+        print(f"Command: {format_commands(ffmpeg_cmds)}")
+
+    # ffmpeg logs and reports progress on stderr, stdout is only worth
+    # passing through to the terminal in verbose mode. Parallel jobs must not
+    # read the terminal: each would grab keystrokes and change its tty settings.
+    stdout = None if verbose else subprocess.DEVNULL
+
+    # Execute ffmpeg command(s)
+    try:
+        if len(ffmpeg_cmds) > 1:
+            # For multipass, run commands sequentially
+            for i, cmd in enumerate(ffmpeg_cmds, 1):
+                print(f"Running pass {i} of {len(ffmpeg_cmds)}...")
+                subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=stdout)
+        else:
+            # For single pass
+            subprocess.run(ffmpeg_cmds[0], check=True, stdin=subprocess.DEVNULL, stdout=stdout)
+
+        print("Conversion successful")
+
+        # If successful and force_m4v is enabled, rename to .m4v
+        if force_m4v:
+            if not rename_to_m4v(output_file, False):
+                print("Warning: Failed to rename file to .m4v")
+
+        return 0
+
+    except subprocess.CalledProcessError as e:
+        print(f"Error: FFmpeg command failed with return code {e.returncode}")
+        if verbose:
             print("Checking input file...")
             get_file_info(input_file)
-            return 1
-    else:
-        print(f"Generated command for {input_file}:")
-        print(ffmpeg_cmd_str)
-        if force_m4v:
-            print(f"Note: If executed, the file will be converted to {actual_format} then renamed to .m4v")
+        else:
+            print("Run with --verbose to see the input file information.")
+        return 1
 
-    return 0
+    finally:
+        # Remove the two-pass statistics, ffmpeg and the encoders add their own suffixes
+        if job['passlog_file']:
+            for stats_file in glob.glob(glob.escape(job['passlog_file']) + '*'):
+                try:
+                    os.remove(stats_file)
+                except OSError:
+                    pass
 
 
 def main():
@@ -507,10 +863,32 @@ def main():
     # Extract settings from the preset
     settings = extract_preset_settings(preset_data)
 
+    # Probe the available encoders once if the encoder may be swapped out
+    encoders = set()
+    if args.hwaccel != 'none' or args.prefer_svtav1:
+        encoders = get_available_encoders()
+
     # Convert to FFmpeg parameters
-    ffmpeg_params = convert_to_ffmpeg_params(settings)
+    ffmpeg_params = convert_to_ffmpeg_params(settings, args.hwaccel, encoders, args.prefer_svtav1)
     ffmpeg_params['preset_name'] = settings['preset_name']  # Add preset name for display
 
+    # Extra presets encoded in the same ffmpeg run as the main one
+    extra_params = []
+    for extra_json in args.multi_output:
+        extra_settings = extract_preset_settings(load_json_preset(extra_json))
+        preset_tag = os.path.splitext(os.path.basename(extra_json))[0]
+        extra_params.append((preset_tag, convert_to_ffmpeg_params(extra_settings, args.hwaccel,
+                                                                  encoders, args.prefer_svtav1)))
+
+    # The extra outputs are encoded from the main command's input, which needs
+    # their hardware setup as well (e.g. the device of a VAAPI encoder)
+    hwaccel = merge_hwaccel_args([ffmpeg_params['hwaccel'], *(params['hwaccel'] for _, params in extra_params)])
+    if hwaccel is None:
+        print("Error: The --multi-output presets need a different hardware decoder than the main preset.",
+              file=sys.stderr)
+        sys.exit(1)
+    ffmpeg_params['hwaccel'] = hwaccel
+
     # Default FFmpeg extended settings
     analyze_duration = 100000000  # 100MB
     probe_size = 100000000        # 100MB
@@ -554,7 +932,7 @@ def main():
     print(f"Searching for media files in {args.input_dir}")
     print(f"Files with the '{args.ignore_flag}' file in their directory will be skipped")
     print(f"Output directory set to: {args.output_dir}")
-    print(f"Using analyzeduration: {analyze_duration}, probesize: {probe_size}")
+    print(f"Using analyzeduration: {analyze_duration}, probesize: {probe_size} (or the file size if smaller)")
 
     if not args.no_underscore_replace:
         print("Underscores in filenames will be replaced with spaces in output files")
@@ -569,47 +947,95 @@ def main():
     if args.verbose:
         print("Verbose output enabled")
 
-    # Find media files
-    media_files = find_media_files(args.input_dir, args.recursive, MEDIA_EXTENSIONS)
+    # Find media files, conversions start while the search is still running
+    media_files = find_media_files(args.input_dir, args.recursive, MEDIA_EXTENSIONS,
+                                   exclude_dir=args.output_dir)
+
+    # Only executed conversions are worth running in parallel; each job gets
+    # an equal share of the CPUs so that jobs * threads ~= cpu_count
+    jobs = 1
+    threads = 0
+    if args.execute and not args.dry_run:
+        cpu_count = os.cpu_count() or 1
+        jobs = args.jobs or max(1, cpu_count // THREADS_PER_JOB)
+        if jobs > 1:
+            threads = max(1, cpu_count // jobs)
+            print(f"Running {jobs} conversions in parallel with {threads} threads each")
+
+    # Everything but the input and output file is the same for the whole batch
+    template = compile_ffmpeg_template(ffmpeg_params, analyze_duration, args.verbose, threads)
+    is_multipass = ffmpeg_params['multipass'] and ffmpeg_params.get('video_quality_type') != '2'
+    extra_outputs = [
+        (preset_tag, params['format'], compile_ffmpeg_template(params, analyze_duration, args.verbose, threads)[1])
+        for preset_tag, params in extra_params
+    ]
+
+    # Codec a file must already have to be remuxed instead of re-encoded
+    remux_codec = ''
+    if args.allow_remux:
+        vcodec = ffmpeg_params['vcodec']
+        remux_codec = ENCODER_CODECS.get(vcodec, vcodec.partition('_')[0])
 
     # Process each file
     file_count = 0
     skipped_count = 0
     error_count = 0
+    output_dirs = {}
 
-    for file in media_files:
-        # Skip JSON file itself
-        if os.path.abspath(file) == os.path.abspath(args.json_file):
-            continue
-
-        # Check if file should be ignored
-        if should_ignore_file(file, args.ignore_flag):
-            print(f"Skipping: {file} (ignore flag found)")
-            skipped_count += 1
-            continue
-
-        # Process the file
-        result = process_file(
-            file,
-            args.input_dir,
-            args.output_dir,
-            ffmpeg_params,
-            original_format,
-            output_format,
-            args.force_m4v,
-            args.execute,
-            args.dry_run,
-            not args.no_underscore_replace,
-            analyze_duration,
-            probe_size,
-            args.verbose
-        )
-
-        if result == 0:
-            file_count += 1
-        else:
-            error_count += 1
-            print(f"Failed to process: {file}")
+    # ffmpeg runs in a subprocess, so threads are enough to overlap the jobs;
+    # the passes of a multipass encode stay sequential inside one job. The
+    # next file is set up here while the workers are still encoding.
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        try:
+            jobs_submitted = []
+
+            for file in media_files:
+                # Check if file should be ignored
+                if should_ignore_file(file, args.ignore_flag):
+                    print(f"Skipping: {file} (ignore flag found)")
+                    skipped_count += 1
+                    continue
+
+                # Prepare the output location and command(s)
+                job = prepare_file(
+                    file,
+                    args.input_dir,
+                    args.output_dir,
+                    template,
+                    is_multipass,
+                    ffmpeg_params['vcodec'],
+                    probe_size,
+                    original_format,
+                    output_format,
+                    args.force_m4v,
+                    args.execute,
+                    args.dry_run,
+                    not args.no_underscore_replace,
+                    output_dirs,
+                    remux_codec,
+                    args.verbose,
+                    extra_outputs
+                )
+
+                if job is None:
+                    error_count += 1
+                    print(f"Failed to process: {file}")
+                elif args.execute and not args.dry_run:
+                    jobs_submitted.append((file, executor.submit(run_job, job, args.force_m4v, args.verbose)))
+                else:
+                    show_job(job, args.force_m4v, args.dry_run)
+                    file_count += 1
+
+            for file, future in jobs_submitted:
+                if future.result() == 0:
+                    file_count += 1
+                else:
+                    error_count += 1
+                    print(f"Failed to process: {file}")
+        except KeyboardInterrupt:
+            # Don't start ffmpeg for the files still queued, only wait for the running ones
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
 
     # Display summary
     print("Processing complete:")